@@ -3,16 +3,31 @@ import torch
 import torch.testing
 from torch.autograd import Function
 import numpy as np
-import scipy as sp
-import scipy.interpolate
 from rebar import dotdict
 from functools import wraps
 
 μ_lims = [-25, +25]
 σ2_lims = [-4, +2]
 
-def evaluate(interp, μd, σd):
-    return torch.as_tensor(interp(μd.detach().numpy(), σd.detach().numpy(), grid=False)).double()
+def cell(grid, x, log=False):
+    """Finds the grid cell each `x` falls in, along with how far across the cell it is. Points 
+    off the end of the grid are clamped to it, same as FITPACK does.
+    
+    The grids are evenly spaced - in log-space if `log` - so the cell index is worked out 
+    arithmetically rather than with a search."""
+    K = len(grid)
+    x = x.detach().double().clamp(float(grid[0]), float(grid[-1]))
+    u, (l, r) = (x.log10(), grid[[0, -1]].log10()) if log else (x, grid[[0, -1]])
+    i = ((u - l)/(r - l)*(K-1)).floor().long().clamp(0, K-2)
+    lo, hi = grid[i], grid[i+1]
+    s = ((x - lo)/(hi - lo)).clamp(0, 1)
+    return i, s
+
+def lookup(table, cells):
+    (i, s), (j, t) = cells
+    return (
+        (1-s)*(1-t)*table[i, j] + s*(1-t)*table[i+1, j] + 
+        (1-s)*t*table[i, j+1] + s*t*table[i+1, j+1])
 
 class Normal(Function):
 
@@ -21,34 +36,39 @@ class Normal(Function):
         μ = np.linspace(*μ_lims, K)
         σ2 = np.logspace(*σ2_lims, K, base=10)
 
+        # Accumulating one quadrature node at a time keeps the working set at K x K, rather 
+        # than materializing all K x K x S evaluation points at once
         zs, ws = np.polynomial.hermite_e.hermegauss(S)
-        ds = (μ[:, None, None] + zs[None, None, :]*σ2[None, :, None]**.5)
-
         scale = 1/(2*np.pi)**.5
-        fs = scale*(f(ds)*ws).sum(-1)
-        f = sp.interpolate.RectBivariateSpline(μ, σ2, fs, kx=1, ky=1)
+        σ = σ2**.5
+        fs = np.zeros((K, K))
+        for z, w in zip(zs, ws):
+            fs += scale*w*f(μ[:, None] + z*σ[None, :])
 
-        dμs = (fs[2:, :] - fs[:-2, :])/(μ[2:] - μ[:-2])[:, None]
-        dμ = sp.interpolate.RectBivariateSpline(μ[1:-1], σ2, dμs, kx=2, ky=2)
-        dσ2s = (fs[:, 2:] - fs[:, :-2])/(σ2[2:] - σ2[:-2])[None, :]
-        dσ2 = sp.interpolate.RectBivariateSpline(μ, σ2[1:-1], dσ2s, kx=2, ky=2)
+        # Putting the derivatives on the same grid as the values means a single cell lookup 
+        # serves all three tables
+        dμs = np.gradient(fs, μ, axis=0)
+        dσ2s = np.gradient(fs, σ2, axis=1)
 
         return dotdict.dotdict(
             μ=μ, σ2=σ2, 
-            f=f, dμ=dμ, dσ2=dσ2, 
-            fs=fs, dμs=dμs, dσs=dσ2s)
+            fs=fs, dμs=dμs, dσs=dσ2s,
+            grids=(torch.as_tensor(μ), torch.as_tensor(σ2)),
+            tables=tuple(map(torch.as_tensor, (fs, dμs, dσ2s))))
 
     @staticmethod
     def forward(ctx, aux, μd, σ2d):
-        ctx.save_for_backward(μd, σ2d)
-        ctx.aux = aux
-        return evaluate(aux.f, μd, σ2d)
+        μs, σ2s = aux.grids
+        cells = (cell(μs, μd), cell(σ2s, σ2d, log=True))
+        # The cells only depend on the inputs, so keep them around for the backward pass
+        ctx.aux, ctx.cells = aux, cells
+        return lookup(aux.tables[0], cells)
 
     @staticmethod
     def backward(ctx, dldf):
-        μd, σ2d = ctx.saved_tensors
-        dfdμ = evaluate(ctx.aux.dμ, μd, σ2d)
-        dfdσ2d = evaluate(ctx.aux.dσ2, μd, σ2d)
+        _, dμs, dσ2s = ctx.aux.tables
+        dfdμ = lookup(dμs, ctx.cells)
+        dfdσ2d = lookup(dσ2s, ctx.cells)
 
         dldμ = dldf*dfdμ
         dldσ2d = dldf*dfdσ2d
@@ -93,4 +113,23 @@ def test_variance():
     expectation = normal(lambda x: x**2)
     actual = expectation(μ, σ2)
 
-    torch.testing.assert_allclose(expected, actual)
\ No newline at end of file
+    torch.testing.assert_allclose(expected, actual)
+def test_lookup():
+    # The tables used to be read through FITPACK's bilinear splines, so the lookup should agree with them
+    from scipy.interpolate import RectBivariateSpline
+
+    K = 101
+    μ = np.linspace(*μ_lims, K)
+    σ2 = np.logspace(*σ2_lims, K, base=10)
+    table = np.random.RandomState(0).normal(size=(K, K))
+    spline = RectBivariateSpline(μ, σ2, table, kx=1, ky=1)
+
+    # Includes points on the grid lines and off both ends of the grids
+    μd = torch.tensor([-30., -25., -3.3, 0., 7.77, 25., 40.], dtype=torch.double)
+    σ2d = torch.tensor([1e-5, 1e-4, 3e-3, 1., 17., 100., 1e3], dtype=torch.double)
+
+    cells = (cell(torch.as_tensor(μ), μd), cell(torch.as_tensor(σ2), σ2d, log=True))
+    actual = lookup(torch.as_tensor(table), cells)
+    expected = torch.as_tensor(spline(μd.numpy(), σ2d.numpy(), grid=False))
+
+    torch.testing.assert_allclose(actual, expected)
@@ -9,19 +9,22 @@ from torch import nn
 import geotorch
 from . import expectations, common
 from logging import getLogger
+from functools import lru_cache
 
 log = getLogger(__name__)
 
 μ0 = 0
 σ0 = 10
 
+@lru_cache()
 def pairwise_indices(N):
+    # Called several times per solver step with the same N, so worth hanging on to
     j, k = torch.as_tensor(np.indices((N, N)).reshape(2, -1))
     j, k = j[j != k], k[j != k]
-    return j, k
+    return j, k, j*N + k
 
 def pairwise_diffs(μ, Σ):
-    j, k = pairwise_indices(len(μ))
+    j, k, _ = pairwise_indices(len(μ))
 
     μd = μ[j] - μ[k]
     σ2d = Σ[j, j] - Σ[j, k] - Σ[k, j] + Σ[k, k]
@@ -30,10 +33,9 @@ def pairwise_diffs(μ, Σ):
 
 def as_square(xd, fill=0.):
     N = int((1 + (1 + 4*len(xd))**.5)/2)
-    j, k = pairwise_indices(N)
-    y = torch.full((N, N), fill).double()
-    y[j, k] = xd
-    return y
+    _, _, flat = pairwise_indices(N)
+    # Out-of-place, so the result can be differentiated through
+    return torch.full((N*N,), fill, dtype=torch.double).index_copy(0, flat, xd.double()).view(N, N)
 
 # def to_double(m):
 #     for m in 
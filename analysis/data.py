@@ -4,7 +4,7 @@ import torch
 from torch import nn
 import pandas as pd
 import scipy as sp
-from tqdm.auto import tqdm
+from concurrent.futures import ThreadPoolExecutor
 from boardlaw import sql, elos
 import aljpy
 from pavlov import stats, runs
@@ -17,40 +17,44 @@ ELO = 400/np.log(10)
 GLOBAL_GAMES = 1024
 
 @aljpy.autocache()
-def _trial_elos(boardsize, counter):
+def _trial_elos(counter):
     # So in the paper we have two evaluation schemes: one where 1024 games are played between all agents,
     # and another where >>64k games are played against the best agent. Both of the these evaluation schemes
     # are saved in the same database, so to stop the 64k-results skewing everything, we grab the first 1000
     # games played by each pair.
-    trials = (sql.trial_query(boardsize)
+    trials = (sql.trial_query_all()
                 .query('black_wins + white_wins >= 512')
                 .groupby(['black_agent', 'white_agent'])
                 .first().reset_index())
-    ws, gs = elos.symmetrize(trials)
 
-    return elos.solve(ws, gs)
+    es = {}
+    for b, g in trials.groupby('boardsize'):
+        ws, gs = elos.symmetrize(g)
+        es[b] = elos.solve(ws, gs)
+    return es
 
 def trial_elos(boardsize):
     counter = sql.file_change_counter()
-    return _trial_elos(boardsize, counter)
+    return _trial_elos(counter)[boardsize]
 
 def load():
     ags = sql.agent_query().query('test_c == 1/16')
 
-    es = []
-    for b in tqdm(ags.boardsize.unique()):
-        es.append(trial_elos(b))
-    es = pd.concat(es)
+    es = _trial_elos(sql.file_change_counter())
+    es = pd.concat(list(es.values()))
 
     return ags.join(es, how='inner')
 
+def _sample_rate(run):
+    arr = stats.array(run, 'count.samples')
+    s, t = arr['total'], arr['_time']
+    return 1e6*(s.sum() - s[0])/(t[-1] - t[0]).astype(float)
+
 def with_times(ags):
-    rates = {}
-    for r in ags.run.unique():
-        arr = stats.array(r, 'count.samples')
-        s, t = arr['total'], arr['_time']
-        rates[r] = 1e6*(s.sum() - s[0])/(t[-1] - t[0]).astype(float)
-    rates = pd.Series(rates, name='sample_rate')
+    # Each run's stats are separate files on disk, so read them concurrently
+    rs = ags.run.unique()
+    with ThreadPoolExecutor(16) as pool:
+        rates = pd.Series(dict(zip(rs, pool.map(_sample_rate, rs))), name='sample_rate')
 
     aug = pd.merge(ags, rates, left_on='run', right_index=True)
     aug['train_time'] = aug.samples/aug.sample_rate
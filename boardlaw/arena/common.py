@@ -87,17 +87,20 @@ def evaluate(worlds, agents):
     matchup_idxs = matchup_indices(worlds.n_envs, worlds.n_seats).to(worlds.device)
     while True:
         for i, (id, agent) in enumerate(agents):
-            mask = (matchup_idxs[envs, worlds.seats.long()] == i) & ~terminal
-            if mask.any():
+            # Boolean-mask indexing does its own nonzero on every use, so convert to indices 
+            # once and gather the agent's worlds just the once.
+            idxs = ((matchup_idxs[envs, worlds.seats.long()] == i) & ~terminal).nonzero().squeeze(-1)
+            if len(idxs):
                 start = time.time()
-                decisions = agent(worlds[mask], eval=True)
-                worlds[mask], transitions = worlds[mask].step(decisions.actions)
-                terminal[mask] = transitions.terminal
+                sub = worlds[idxs]
+                decisions = agent(sub, eval=True)
+                worlds[idxs], transitions = sub.step(decisions.actions)
+                terminal[idxs] = transitions.terminal
                 end = time.time()
 
-                wins[mask] += (transitions.rewards == 1).int()
-                moves[mask] += 1
-                times[mask] += (end - start)/mask.sum()
+                wins[idxs] += (transitions.rewards == 1).int()
+                moves[idxs] += 1
+                times[idxs] += (end - start)/len(idxs)
 
         if terminal.all():
             break
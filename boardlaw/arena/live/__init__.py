@@ -39,18 +39,20 @@ def offdiag_refill(run, names, queue, count=1):
             .reindex(index=names, columns=names)
             .fillna(0))
 
-    for (i, j) in queue:
-        ni, nj = names[i], names[j]
-        n.loc[ni, nj] += 1
-
-    rs, cs = np.indices(n.shape)
-    mask = ((rs == cs + 1) | (rs == cs - 1))
-    excess = (n.values - n.values[mask].min())
-    excess[~mask] = np.inf
+    n = n.to_numpy(copy=True)
+    if queue:
+        np.add.at(n, tuple(np.array(queue).T), 1)
+
+    # Only the cells either side of the diagonal are candidates, so enumerate those 
+    # directly rather than masking the whole matrix
+    N = len(names)
+    rs = np.concatenate([np.arange(1, N), np.arange(N-1)])
+    cs = np.concatenate([np.arange(N-1), np.arange(1, N)])
+    excess = n[rs, cs] - n[rs, cs].min()
     probs = np.exp(-excess)/np.exp(-excess).sum()
     while len(queue) < count:
-        idx = np.random.choice(np.arange(n.size), p=probs.flatten())
-        pair = (idx // n.shape[0], idx % n.shape[0])
+        idx = np.random.choice(len(rs), p=probs)
+        pair = (rs[idx], cs[idx])
 
         queue.append(pair)
         queue.append(pair[::-1])
@@ -131,6 +133,24 @@ def append(df, name):
     names = list(df.index) + [name]
     return df.reindex(index=names, columns=names).fillna(0)
 
+def add_results(games, wins, results):
+    # Four label lookups per result adds up over a long history, so gather the positions 
+    # up front and do one scatter into each matrix.
+    if not results:
+        return games, wins
+    idx = {n: k for k, n in enumerate(games.index)}
+    i = np.array([idx[r.names[0]] for r in results])
+    j = np.array([idx[r.names[1]] for r in results])
+    g = np.array([r.games for r in results], dtype=float)
+    w = np.array([r.wins for r in results], dtype=float)
+
+    G, W = games.values.astype(float), wins.values.astype(float)
+    np.add.at(G, (i, j), g)
+    np.add.at(G, (j, i), g)
+    np.add.at(W, (i, j), w[:, 0])
+    np.add.at(W, (j, i), w[:, 1])
+    return pd.DataFrame(G, games.index, games.columns), pd.DataFrame(W, wins.index, wins.columns)
+
 class RollingArena:
 
     def __init__(self, worlds, max_history):
@@ -144,11 +164,7 @@ class RollingArena:
         size = self.worlds.boardsize
         games = json.symmetric_games(f'mohex-{size}').pipe(append, 'agent')
         wins = json.symmetric_wins(f'mohex-{size}').pipe(append, 'agent')
-        for result in self.history:
-            games.loc[result.names[0], result.names[1]] += result.games
-            games.loc[result.names[1], result.names[0]] += result.games
-            wins.loc[result.names[0], result.names[1]] += result.wins[0]
-            wins.loc[result.names[1], result.names[0]] += result.wins[1]
+        games, wins = add_results(games, wins, list(self.history))
 
         self.soln = activelo.solve(games, wins, soln=self.soln)
         μ, σ = analysis.difference(self.soln, 'mohex-0.00', 'agent')
@@ -208,3 +224,25 @@ def run(*args, **kwargs):
             log.info('Abruptly terminating arena monitor; it should have shut down naturally!')
             p.terminate()
 
+
+def test_add_results():
+    from rebar import dotdict
+    names = ['a', 'b', 'c']
+    games = pd.DataFrame(np.ones((3, 3)), names, names)
+    wins = pd.DataFrame(np.zeros((3, 3)), names, names)
+    results = [
+        dotdict.dotdict(names=('a', 'b'), games=3., wins=(2., 1.)),
+        dotdict.dotdict(names=('b', 'a'), games=2., wins=(0., 2.)),
+        dotdict.dotdict(names=('a', 'b'), games=1., wins=(1., 0.)),
+        dotdict.dotdict(names=('c', 'c'), games=4., wins=(3., 1.))]
+
+    expected_games, expected_wins = games.copy(), wins.copy()
+    for result in results:
+        expected_games.loc[result.names[0], result.names[1]] += result.games
+        expected_games.loc[result.names[1], result.names[0]] += result.games
+        expected_wins.loc[result.names[0], result.names[1]] += result.wins[0]
+        expected_wins.loc[result.names[1], result.names[0]] += result.wins[1]
+
+    actual_games, actual_wins = add_results(games, wins, results)
+    pd.testing.assert_frame_equal(actual_games, expected_games)
+    pd.testing.assert_frame_equal(actual_wins, expected_wins)
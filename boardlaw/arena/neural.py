@@ -11,6 +11,7 @@ from rebar import arrdict, dotdict, parallel
 from logging import getLogger
 from itertools import combinations
 from random import shuffle
+from concurrent.futures import wait, FIRST_COMPLETED
 from multiprocessing import set_start_method
 from . import common
 from .. import sql, elos
@@ -30,7 +31,9 @@ def scatter_add_(totals, indices, vals=None):
     if isinstance(vals, (int, float)):
         vals = totals.new_full((len(rows),), vals)
 
-    totals.view(-1).scatter_add_(0, raveled, vals)
+    # Only the two index dims get flattened, so vector-valued entries - like the per-seat 
+    # wins - go in with one call rather than one per component
+    totals.view(-1, *totals.shape[2:]).index_add_(0, raveled, vals)
 
 def live_indices(residual):
     # Want to have residual[i, j] copies of (i, j) in the output
@@ -135,10 +138,8 @@ class ChunkEvaluator:
         return self.tracker.finished()
 
     def record(self, transitions, live, start, end):
-        #TODO: Figure out how to get scatter_add_ to work on vector-valued vals
         wins = (transitions.rewards == 1).int()
-        scatter_add_(self.stats.wins[:, :, 0], live, wins[:, 0])
-        scatter_add_(self.stats.wins[:, :, 1], live, wins[:, 1])
+        scatter_add_(self.stats.wins, live, wins)
         scatter_add_(self.stats.moves, live, 1) 
         scatter_add_(self.stats.times, live, (end - start)/transitions.terminal.size(0))
 
@@ -272,8 +273,10 @@ def evaluate_gen(worldfunc, agentfunc, games, n_envs_per=512, chunks=64, n_worke
             with parallel.parallel(evaluate_chunk, N=n_workers, executor='cuda') as pool:
                 pool_jobs = {k: pool(worldfunc, agentfunc, jobs[k], n_envs_per) for k in idxs if k not in completed_idxs}
                 while pool_jobs:
+                    # Block until something finishes, rather than sleeping a fixed interval and polling
+                    done, _ = wait(list(pool_jobs.values()), timeout=.1, return_when=FIRST_COMPLETED)
                     for k, future in list(pool_jobs.items()):
-                        if future.done():
+                        if future in done:
                             results = future.result()
                             update_stats(stats, results)
                             completed_idxs.add(k)
@@ -284,7 +287,6 @@ def evaluate_gen(worldfunc, agentfunc, games, n_envs_per=512, chunks=64, n_worke
 
                     stats['end'] = time.time()
                     yield [], stats.copy()
-                    time.sleep(.1)
             finished = True
         except torch.cuda.OutOfMemoryError as e:
             with open('execution.log', 'a') as f:
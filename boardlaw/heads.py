@@ -10,6 +10,16 @@ Masked = namedtuple('Masked', ('dim',))
 Vector = namedtuple('Vector', ('dim',))
 Tensor = namedtuple('Tensor', ('dim',))
 
+def sample(logits):
+    """Draws from the categorical given by `logits` using the Gumbel-max trick, which is a couple 
+    of elementwise ops and an argmax rather than a whole `Categorical`. Going back to float 
+    here because halves don't have the resolution for the noise."""
+    logits = logits.float()
+    # Clamping stops a zero draw turning into infinite noise, which would make a nan out of 
+    # an invalid action's -inf logit
+    draws = torch.empty_like(logits).exponential_().clamp_(min=torch.finfo(logits.dtype).tiny)
+    return (logits - draws.log()).argmax(-1)
+
 class EmptyIntake(nn.Module):
 
     def __init__(self, space, width):
@@ -88,7 +98,7 @@ class DiscreteOutput(nn.Module):
         if test:
             return logits.argmax(-1)
         else:
-            return torch.distributions.Categorical(logits=logits).sample()
+            return sample(logits)
 
 class MaskedOutput(nn.Module):
 
@@ -107,7 +117,7 @@ class MaskedOutput(nn.Module):
         if test:
             return logits.argmax(-1)
         else:
-            return torch.distributions.Categorical(logits=logits).sample()
+            return sample(logits)
 
 class DictOutput(nn.Module):
 
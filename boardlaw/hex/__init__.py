@@ -267,7 +267,7 @@ class Random(Solitaire):
 
     @classmethod
     def _play(cls, worlds):
-        actions = torch.distributions.Categorical(probs=worlds.valid.float()).sample()
+        actions = heads.sample(worlds.valid.float().log())
         return Hex.step(worlds, actions)
 
 
@@ -2,10 +2,11 @@ import torch
 import numpy as np
 from itertools import cycle
 from rebar import arrdict
+from . import heads
 
 def mix(worlds, T=2500):
     for _ in range(T):
-        actions = torch.distributions.Categorical(probs=worlds.valid.float()).sample()
+        actions = heads.sample(worlds.valid.float().log())
         worlds, transitions = worlds.step(actions)
     return worlds
 
@@ -60,10 +61,15 @@ def present_value(deltas, fallback, terminal, alpha):
     # advantages, reset: fall back to delta
     # advantages, terminal: fall back to delta
     assert_same_shape(deltas, fallback[:-1], terminal[:-1])
+    return _present_value(deltas, fallback, terminal, float(alpha))
 
-    result = torch.full_like(fallback, np.nan)
+@torch.jit.script
+def _present_value(deltas, fallback, terminal, alpha: float):
+    # Scripted so the backwards scan runs without going back through the interpreter 
+    # on every step
+    result = torch.full_like(fallback, float('nan'))
     result[-1] = fallback[-1]
-    for t in np.arange(deltas.size(0))[::-1]:
+    for t in range(deltas.size(0)-1, -1, -1):
         result[t] = torch.where(terminal[t], fallback[t], deltas[t] + alpha*result[t+1])
     return result
 
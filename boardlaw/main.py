@@ -57,21 +57,87 @@ def chunk_stats(chunk, n_new):
         w = t.rewards[1:][t.terminal[1:]]
         stats.mean('corr.penultimate', ((v - v.mean())*(w - w.mean())).mean()/(v.var()*w.var())**.5)
 
+class Buffer:
+    """Ring buffer over the last `length` steps of experience. 
+    
+    The steps are stacked once when the buffer first fills, and after that each new step is written 
+    in place into the slot of the one it replaces. `stack` gathers the whole lot back into time order, 
+    which is fine for one-off use, but the learner goes through `as_batch` instead, which only puts the 
+    small per-env fields in order and reads the rows it samples straight out of the slots."""
+
+    def __init__(self, length):
+        self.length = length
+        self._pending = []
+        self.storage = None
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, step):
+        assert self._size < self.length, 'Buffer is full'
+        if self.storage is None:
+            self._pending.append(step)
+            if len(self._pending) == self.length:
+                self.storage = arrdict.stack(self._pending)
+                self._pending = []
+        else:
+            self.storage[self.slots(self._size)] = step
+        self._size += 1
+
+    def slots(self, t):
+        """Maps time indices, counting from the oldest step, onto storage slots"""
+        return (self._head + t) % self.length
+
+    def stack(self):
+        assert self._size == self.length, 'Buffer needs to be full to be stacked'
+        return self.storage[self.slots(torch.arange(self.length))]
+
+    def drop(self, n):
+        self._head = (self._head + n) % self.length
+        self._size -= n
+
+def _reward_to_go(transitions, v, n_seats):
+    terminal = torch.stack([transitions.terminal for _ in range(n_seats)], -1)
+    return learning.reward_to_go(transitions.rewards.float(), v.float(), terminal).half()
+
 def as_chunk(buffer, batch_size):
-    chunk = arrdict.stack(buffer)
-    terminal = torch.stack([chunk.transitions.terminal for _ in range(chunk.worlds.n_seats)], -1)
-    chunk['reward_to_go'] = learning.reward_to_go(
-        chunk.transitions.rewards.float(), 
-        chunk.decisions.v.float(), 
-        terminal).half()
-
-    n_new = batch_size//terminal.size(1)
+    chunk = buffer.stack()
+    chunk['reward_to_go'] = _reward_to_go(chunk.transitions, chunk.decisions.v, chunk.worlds.n_seats)
+
+    n_new = batch_size//chunk.transitions.terminal.size(1)
     chunk_stats(chunk, n_new)
             
-    buffer = buffer[n_new:]
+    buffer.drop(n_new)
 
     return chunk, buffer
 
+def as_batch(buffer, batch_size, idxs):
+    """Same as `as_chunk(buffer, batch_size)[0][idxs]`, but without gathering the whole buffer into time order. 
+    Only the fields that reward-to-go and the stats need get put in order."""
+    assert len(buffer) == buffer.length, 'Buffer needs to be full to be batched'
+    storage = buffer.storage
+    order = buffer.slots(torch.arange(buffer.length, device=storage.transitions.terminal.device))
+    summary = arrdict.arrdict(
+        transitions=storage.transitions[order],
+        decisions=arrdict.arrdict(
+            v=storage.decisions.v[order],
+            n_sims=storage.decisions.n_sims[order],
+            n_leaves=storage.decisions.n_leaves[order]))
+    reward_to_go = _reward_to_go(summary.transitions, summary.decisions.v, storage.worlds.n_seats)
+
+    n_new = batch_size//summary.transitions.terminal.size(1)
+    chunk_stats(summary, n_new)
+
+    t, envs = idxs
+    batch = storage[buffer.slots(t), envs]
+    batch['reward_to_go'] = reward_to_go[t, envs]
+
+    buffer.drop(n_new)
+
+    return batch
+
 def optimize(network, scaler, opt, batch):
 
     with torch.cuda.amp.autocast():
@@ -102,7 +168,7 @@ def optimize(network, scaler, opt, batch):
         #TODO: Contract these all based on late-ness
         stats.mean('loss.value', value_loss)
         stats.mean('loss.policy', policy_loss)
-        stats.mean('corr.resid-var', (target_value - d.v).pow(2).mean(), target_value.pow(2).mean())
+        stats.mean('corr.resid-var', value_loss, target_value.pow(2).mean())
 
         p0 = d0.prior.float().where(d0.prior > -np.inf, zeros)
         stats.mean('kl-div.behaviour', (p0 - l0).mul(p0.exp()).sum(-1).mean())
@@ -160,7 +226,7 @@ def run(boardsize, width, depth, desc, nodes=64, c_puct=1/16, lr=1e-3, n_envs=32
 
     storer = storage.FlopsStorer(run, agent, width=width, depth=depth)
 
-    buffer = []
+    buffer = Buffer(buffer_len)
     with logs.to_run(run), stats.to_run(run), \
             arena.live.run(run):
         #TODO: Upgrade this to handle batches that are some multiple of the env count
@@ -183,8 +249,8 @@ def run(boardsize, width, depth, desc, nodes=64, c_puct=1/16, lr=1e-3, n_envs=32
                 #log.info(f'({len(buffer)}/{buffer_len}) actor stepped')
 
             # Optimize
-            chunk, buffer = as_chunk(buffer, n_envs)
-            optimize(network, scaler, opt, chunk[idxs])
+            batch = as_batch(buffer, n_envs, idxs)
+            optimize(network, scaler, opt, batch)
             #log.info(f'learner stepped ({len(buffer)}/{buffer_len})')
 
             stats.gpu(worlds.device, 15)
@@ -207,3 +273,20 @@ def run_jittens():
 def run_noisescale():
     for _, row in BEST.astype(object).iterrows():
         run(**row, desc='noise-scale') 
+
+def test_buffer():
+    buffer = Buffer(4)
+    for i in range(4):
+        buffer.append(arrdict.arrdict(x=torch.tensor([i, 10+i])))
+    assert buffer.stack().x[:, 0].tolist() == [0, 1, 2, 3]
+
+    # Wrap around the end of the storage
+    buffer.drop(3)
+    for i in range(4, 7):
+        buffer.append(arrdict.arrdict(x=torch.tensor([i, 10+i])))
+    chunk = buffer.stack()
+    assert chunk.x[:, 0].tolist() == [3, 4, 5, 6]
+
+    # Reading through the slots gives the same rows as indexing the ordered stack
+    t, envs = torch.tensor([0, 3, 1]), torch.tensor([1, 0, 0])
+    assert buffer.storage[buffer.slots(t), envs].x.tolist() == chunk[t, envs].x.tolist()
@@ -5,6 +5,7 @@ import torch
 import torch.distributions
 from rebar import arrdict
 from . import cuda
+from .. import heads
 import logging
 from rebar import profiling
 
@@ -23,6 +24,11 @@ def dirichlet_noise(logits, valid, eps, alpha_scale=10):
 
     return (logits.exp()*(1 - eps) + draw*eps).log()
 
+@arrdict.mapping
+def node_buffer(x, n_nodes):
+    # Every node gets written by `simulate` before it's read, so there's no need to fill 
+    # the buffer with n_nodes copies of the root up front.
+    return x.new_empty((x.shape[0], n_nodes, *x.shape[1:]))
 
 class MCTS:
 
@@ -45,7 +51,7 @@ class MCTS:
             parents=self.envs.new_full((world.n_envs, self.n_nodes), -1, dtype=torch.short),
             relation=self.envs.new_full((world.n_envs, self.n_nodes), -1, dtype=torch.short))
 
-        self.worlds = arrdict.stack([world for _ in range(self.n_nodes)], 1)
+        self.worlds = node_buffer(world, self.n_nodes)
         
         self.transitions = arrdict.arrdict(
             rewards=torch.full((world.n_envs, self.n_nodes, self.n_seats), 0., device=self.device, dtype=torch.half),
@@ -71,7 +77,8 @@ class MCTS:
 
     def initialize(self, network):
         world = self.worlds[:, 0]
-        with torch.no_grad():
+        autocast = (world.device.type == 'cuda')
+        with torch.no_grad(), torch.cuda.amp.autocast(autocast):
             decisions = network(world)
             assert (decisions.logits > -np.inf).any(-1).all(), 'Some row of logits are all neginf or nan'
         self.decisions.logits[:, self.sim] = dirichlet_noise(decisions.logits, world.valid, self.noise_eps, self.alpha_scale)
@@ -217,8 +224,7 @@ class MCTSAgent:
         m = mcts(world, self.network, **{**self.kwargs, **kwargs})
         r = m.root()
 
-        # Need to go back to float here because `sample` doesn't like halves
-        actions = r.logits.argmax(-1) if eval else torch.distributions.Categorical(logits=r.logits.float()).sample()
+        actions = r.logits.argmax(-1) if eval else heads.sample(r.logits)
 
         return arrdict.arrdict(
             logits=r.logits,
@@ -247,7 +253,7 @@ class DummyAgent:
 
     def __call__(self, world, eval=False):
         r = self.network(world)
-        actions = r.logits.argmax(-1) if eval else torch.distributions.Categorical(logits=r.logits.float()).sample()
+        actions = r.logits.argmax(-1) if eval else heads.sample(r.logits)
         return arrdict.arrdict(
             logits=r.logits,
             prior=r.logits,
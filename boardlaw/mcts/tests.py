@@ -238,6 +238,23 @@ def test_backup_terminal():
 from .. import validation, analysis
 from . import mcts, MCTSAgent
 
+def test_initialize():
+    from . import MCTS
+    world = validation.All.initial(n_envs=3, length=2, device='cuda')
+    m = MCTS(world, n_nodes=4)
+
+    # The root holds the world; the other nodes are left for `simulate` to fill
+    assert m.worlds.history.shape == (3, 4, *world.history.shape[1:])
+    assert (m.worlds[:, 0].history == world.history).all()
+    assert (m.worlds[:, 0].count == world.count).all()
+
+    m.initialize(validation.ProxyAgent())
+    assert m.sim == 1
+    assert m.decisions.logits.dtype == torch.half
+    assert not m.decisions.logits[:, 0].isnan().any()
+    assert m.decisions.logits[:, 1:].isnan().all()
+    torch.testing.assert_allclose(m.decisions.v[:, 0].float(), world.v.float())
+
 #TODO: The 'v' all need to be rewritten to test something else.
 def test_trivial():
     world = validation.Win.initial(device='cuda')
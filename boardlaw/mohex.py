@@ -5,7 +5,7 @@ from select import select
 from logging import getLogger
 import shlex
 import time
-from . import hex
+from . import hex, heads
 from rebar import arrdict
 from tempfile import NamedTemporaryFile
 
@@ -199,7 +199,7 @@ class MoHexAgent:
         self._load(worlds)
 
         assert worlds.n_envs <= self.max_proxies
-        actions = torch.distributions.Categorical(probs=worlds.valid.float()).sample()
+        actions = heads.sample(worlds.valid.float().log())
         use_mohex = torch.rand(worlds.n_envs) >= self.random
 
         futures = {}
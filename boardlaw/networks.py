@@ -15,7 +15,9 @@ class ReZeroResidual(nn.Linear):
         self.register_parameter('α', nn.Parameter(torch.zeros(())))
 
     def forward(self, x, *args, **kwargs):
-        return x + self.α*super().forward(F.relu(x))
+        y = super().forward(F.relu(x))
+        # addcmul's on autocast's promote list, so α has to match y or the whole stream goes to fp32
+        return torch.addcmul(x, self.α.to(y.dtype), y)
 
 class FCModel(nn.Module):
 
@@ -40,7 +40,7 @@ def collect(agent_id, n_envs=32*1024):
     agent = stored_agent(agent_id)
     worlds = stored_worlds(agent_id, n_envs)
 
-    buffer = []
+    buffer = main.Buffer(64)
     while True:
         while len(buffer) < 64:
             with torch.no_grad():
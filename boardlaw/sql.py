@@ -1,14 +1,17 @@
-import numpy as np
 import pandas as pd
 import aljpy.download
 import sqlalchemy
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, create_engine, event
+from sqlalchemy.pool import StaticPool
 from pavlov import runs, storage
 import ast
+import os
 from tqdm.auto import tqdm
 from pathlib import Path
 from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
 
 log = getLogger(__name__)
@@ -160,18 +163,39 @@ class NoiseScale(Base):
     batch_size = Column(Float)
     batches = Column(Float) 
 
-_engine = None
-@contextmanager
-def connection():
+@lru_cache()
+def engine():
     if not DATABASE.parent.exists():
         DATABASE.parent.mkdir(exist_ok=True, parents=True)
     if not DATABASE.exists():
         log.info('Downloading the SQL database')
         DATABASE.write_bytes(aljpy.download.download(URL))
 
-    global _engine
-    _engine = create_engine('sqlite:///' + str(DATABASE)) if _engine is None else _engine
-    with _engine.connect() as conn:
+    # A static pool hands out the same underlying SQLite connection every time, so the 
+    # many small queries the analysis code makes don't each reopen the file and reparse 
+    # the schema.
+    e = create_engine('sqlite:///' + str(DATABASE), 
+        poolclass=StaticPool, 
+        connect_args={'check_same_thread': False})
+
+    @event.listens_for(e, 'connect')
+    def pragmas(dbapi_conn, record):
+        # Not using WAL mode here: it stops SQLite bumping the change counter in the 
+        # file header, and `file_change_counter` relies on that for cache invalidation.
+        # That means a rollback journal, where anything less than synchronous=FULL risks 
+        # corrupting the results on a power cut, so the syncs stay.
+        cursor = dbapi_conn.cursor()
+        cursor.execute('PRAGMA synchronous=FULL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA cache_size=-65536')
+        cursor.execute('PRAGMA mmap_size=268435456')
+        cursor.close()
+
+    return e
+
+@contextmanager
+def connection():
+    with engine().connect() as conn:
         yield conn
 
 def create():
@@ -188,6 +212,24 @@ def create():
                 inner join snaps on (agents.snap == snaps.id)
                 inner join runs on (snaps.run == runs.run)''')
 
+    create_indices()
+
+INDICES = {
+    'ix_trials_black': 'trials(black_agent)',
+    'ix_trials_white': 'trials(white_agent)',
+    'ix_mohex_trials_black': 'mohex_trials(black_agent)',
+    'ix_mohex_trials_white': 'mohex_trials(white_agent)',
+    'ix_agents_snap_nodes_c': 'agents(snap, nodes, c)',
+    'ix_snaps_run': 'snaps(run)'}
+
+def create_indices():
+    """Indexes the columns that `trial_query` and `agents_details` join on. Safe to call on an existing
+    database, such as the downloaded one."""
+    with connection() as conn:
+        for name, target in INDICES.items():
+            conn.execute(f'create index if not exists {name} on {target}')
+        conn.execute('analyze')
+
 def run_data():
     r = runs.pandas().loc[lambda df: df._created >= FIRST_RUN]
     params = r.params.dropna().apply(pd.Series).reindex(r.index)
@@ -195,18 +237,23 @@ def run_data():
     insert['nodes'] = insert.nodes.fillna(64)
     return insert.reset_index(drop=True)
 
-def snapshot_data(new_runs):
-    snapshots = {}
-    for _, r in tqdm(list(new_runs.iterrows()), desc='snapshots'):
-        for i, s in storage.snapshots(r.run).items():
-            stored = storage.load_snapshot(r.run, i)
-            if 'n_samples' in stored:
-                snapshots[r.run, i] = {
-                    'samples': stored['n_samples'], 
-                    'flops': stored['n_flops']}
-    snapshots = (pd.DataFrame.from_dict(snapshots, orient='index')
-                    .rename_axis(index=('run', 'idx'))
-                    .reset_index())
+def _snapshot_counts(path):
+    stored = storage.load_path(path)
+    if 'n_samples' in stored:
+        return {'samples': stored['n_samples'], 'flops': stored['n_flops']}
+
+def snapshot_data(new_runs, n_workers=32):
+    # Loading the snapshots is almost all waiting on disk, so it's worth fanning out over a 
+    # bunch of threads. The paths are resolved up front so the workers don't contend over 
+    # the run info files.
+    paths = [(run, i, s['path']) for run in new_runs.run for i, s in storage.snapshots(run).items()]
+
+    with ThreadPoolExecutor(n_workers) as pool:
+        counts = pool.map(_snapshot_counts, [p for _, _, p in paths])
+        counts = tqdm(counts, total=len(paths), desc='snapshots')
+        records = [{'run': run, 'idx': i, **c} for (run, i, _), c in zip(paths, counts) if c is not None]
+
+    snapshots = pd.DataFrame.from_records(records, columns=['run', 'idx', 'samples', 'flops'])
     # snapshots['id'] = snapshots.index.to_series()
     return snapshots
 
@@ -222,28 +269,33 @@ def refresh_runs():
 
     return new
 
+RUN_BATCH = 900
+
 def create_agents(runs, test_nodes=64, c=1/16, dry_run=False):
-    with connection() as conn:
-        snaps = pd.read_sql_query('select * from snaps', conn, index_col='id')
-
-        agents = (snaps.index
-            [snaps.run.isin(runs.run)]
-            .to_frame(name='snap')
-            .reset_index(drop=True))
-        agents['nodes'] = test_nodes
-        agents['c'] = c
-
-        old_agents = pd.read_sql_query('select * from agents', conn)
-        old_agents = pd.merge(
-            agents.rename_axis(index='idx').reset_index(), 
-            old_agents, 
-            on=['snap', 'nodes', 'c'], how='inner')
-        new_agents = agents[~agents.index.isin(old_agents.idx)]
-
-        if dry_run:
-            print(new_agents)
-        else:
-            new_agents.to_sql('agents', conn, index=False, if_exists='append')
+    # Lets SQLite do the filtering and the anti-join against the existing agents, so only the 
+    # rows that actually need inserting come back.
+    # The run names are bound in batches to stay under the 999-variable cap on old SQLite builds.
+    names = list(runs.run)
+    test_nodes, c = int(test_nodes), float(c)
+    batches = []
+    for i in range(0, max(len(names), 1), RUN_BATCH):
+        batch = names[i:i+RUN_BATCH]
+        placeholders = ', '.join('?'*len(batch))
+        batches.append(query(f'''
+            select snaps.id as snap, ? as nodes, ? as c
+            from snaps
+            where 
+                (snaps.run in ({placeholders})) and 
+                not exists (
+                    select 1 from agents 
+                    where (agents.snap == snaps.id) and (agents.nodes == ?) and (agents.c == ?))
+            order by snaps.id''', params=(test_nodes, c, *batch, test_nodes, c)))
+    new_agents = pd.concat(batches).sort_values('snap').reset_index(drop=True)
+
+    if dry_run:
+        print(new_agents)
+    else:
+        _append('agents', new_agents)
 
 def execute(sql, *args, **kwargs):
     with connection() as conn:
@@ -264,9 +316,9 @@ def query_one(sql, *args, **kwargs):
 def agent_query():
     return query('''select * from agents_details''', index_col='id')
 
-def trial_query(boardsize=None, desc='%', test_nodes=None):
-    q = '''
-        select trials.* 
+def _trial_query(select, boardsize=None, desc='%', test_nodes=None):
+    q = f'''
+        select {select} 
         from trials 
             inner join agents_details as black
                 on (trials.black_agent == black.id)
@@ -286,34 +338,40 @@ def trial_query(boardsize=None, desc='%', test_nodes=None):
     
     return query(q, index_col='id', params=params)
 
-def save_trials(results):
-    rows = []
-    for r in results:
-        rows.append({
-            'black_agent': r.names[0],
-            'white_agent': r.names[1],
-            'black_wins': r.wins[0],
-            'white_wins': r.wins[1],
-            'moves': r.moves,
-            'times': r.times})
-    rows = pd.DataFrame(rows)
+def trial_query(boardsize=None, desc='%', test_nodes=None):
+    return _trial_query('trials.*', boardsize, desc, test_nodes)
+
+def trial_query_all(desc='%', test_nodes=None):
+    # Same as calling `trial_query` once per boardsize and concatenating, but with only one 
+    # pass over the joins. 
+    return (_trial_query('trials.*, black.boardsize, white.boardsize as white_boardsize', desc=desc, test_nodes=test_nodes)
+                .loc[lambda df: df.boardsize == df.white_boardsize]
+                .drop(columns='white_boardsize'))
+
+# SQLite builds before 3.32 cap a statement at 999 bound variables, so this keeps 
+# a multi-row insert of a six-column table under the limit.
+CHUNKSIZE = 100
+
+TRIAL_COLUMNS = ['black_agent', 'white_agent', 'black_wins', 'white_wins', 'moves', 'times']
+
+def _append(table, rows):
+    # One transaction for the whole batch, so SQLite only syncs once, and multi-row inserts
+    # so there's one statement per chunk rather than one per row.
     with connection() as conn:
-        rows.to_sql('trials', conn, index=False, if_exists='append')
+        with conn.begin():
+            rows.to_sql(table, conn, index=False, if_exists='append', method='multi', chunksize=CHUNKSIZE)
+
+def _trial_rows(results):
+    rows = [(r.names[0], r.names[1], r.wins[0], r.wins[1], r.moves, r.times) for r in results]
+    return pd.DataFrame(rows, columns=TRIAL_COLUMNS)
+
+def save_trials(results):
+    _append('trials', _trial_rows(results))
 
 def save_mohex_trials(results):
-    rows = []
     for r in results:
         assert sum(n is None for n in r.names) == 1, 'One agent should be MoHex'
-        rows.append({
-            'black_agent': r.names[0],
-            'white_agent': r.names[1],
-            'black_wins': r.wins[0],
-            'white_wins': r.wins[1],
-            'moves': r.moves,
-            'times': r.times})
-    rows = pd.DataFrame(rows)
-    with connection() as conn:
-        rows.to_sql('mohex_trials', conn, index=False, if_exists='append')
+    _append('mohex_trials', _trial_rows(results))
 
 def mohex_trial_query(boardsize, desc='%'):
     return query('''
@@ -333,8 +391,42 @@ def save_noise_scale(rows):
     with connection() as conn:
         rows.to_sql('noise_scales', conn, index=False, if_exists='append')
 
+_db_fd = None
 def file_change_counter():
     # https://www.sqlite.org/fileformat.html
-    counter = DATABASE.open('rb').read(30)[24:28]
-    dt = np.dtype('int32').newbyteorder('>')
-    return int(np.frombuffer(counter, dtype=dt))
\ No newline at end of file
+    # Keeps the file open between calls, since this gets called as part of the cache key for 
+    # most of the analysis functions.
+    global _db_fd
+    if _db_fd is None:
+        engine() # makes sure the database has been downloaded
+        _db_fd = os.open(str(DATABASE), os.O_RDONLY)
+    return int.from_bytes(os.pread(_db_fd, 4, 24), 'big')
+
+def test_create_agents():
+    import tempfile
+    global DATABASE
+    old = DATABASE
+    with tempfile.TemporaryDirectory() as d:
+        DATABASE = Path(d) / 'database.sql'
+        DATABASE.touch()
+        engine.cache_clear()
+        try:
+            create()
+
+            # Enough runs to need more than one batch of names
+            names = [f'run-{i}' for i in range(RUN_BATCH + 100)]
+            snaps = pd.DataFrame([(n, i, 0., 0.) for n in names for i in range(2)], columns=['run', 'idx', 'samples', 'flops'])
+            _append('snaps', snaps)
+
+            # Two snaps already have a matching agent, and one has an agent with different settings
+            existing = [(1, 64, 1/16), (2*RUN_BATCH + 5, 64, 1/16), (2, 32, 1/16)]
+            _append('agents', pd.DataFrame(existing, columns=['snap', 'nodes', 'c']))
+
+            create_agents(pd.DataFrame({'run': names}), test_nodes=64, c=1/16)
+
+            agents = query('select snap from agents where (nodes == 64) and (c == ?)', 1/16)
+            assert sorted(agents.snap) == list(range(1, len(snaps)+1))
+        finally:
+            engine().dispose()
+            engine.cache_clear()
+            DATABASE = old
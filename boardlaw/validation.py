@@ -24,9 +24,10 @@ class RandomAgent:
 
     def __call__(self, world, value=True):
         B, _ = world.valid.shape
+        logits = uniform_logits(world.valid)
         return arrdict.arrdict(
-            logits=torch.log(world.valid.float()/world.valid.sum(-1, keepdims=True)),
-            actions=torch.distributions.Categorical(probs=world.valid.float()).sample(),
+            logits=logits,
+            actions=heads.sample(logits),
             v=torch.zeros((B, world.n_seats), device=world.device))
 
 class MonteCarloAgent:
@@ -45,7 +46,7 @@ class MonteCarloAgent:
             if not live.any():
                 break
 
-            actions = torch.distributions.Categorical(probs=world.valid.float()).sample()
+            actions = heads.sample(world.valid.float().log())
             if first_actions is None:
                 first_actions = actions
 
@@ -60,10 +61,12 @@ class MonteCarloAgent:
         envs = torch.arange(world.n_envs, device=world.device)
         totals = torch.stack([torch.zeros_like(world.valid, dtype=torch.float) for _ in range(world.n_seats)], -1)
         counts = torch.zeros_like(totals)
-        for _ in range(self.n_rollouts):
-            r, a = self.rollout(world)
-            totals[envs, a[:, None], :] += r[:, None]
-            counts[envs, a[:, None], :] += torch.ones_like(r[:, None])
+
+        # Play all the rollouts side-by-side as one big batch rather than one after another
+        r, a = self.rollout(arrdict.cat([world for _ in range(self.n_rollouts)]))
+        rollout_envs = envs.repeat(self.n_rollouts)
+        totals.index_put_((rollout_envs, a), r, accumulate=True)
+        counts.index_put_((rollout_envs, a), torch.ones_like(r), accumulate=True)
         means = totals.div(counts).where(counts > 0, torch.zeros_like(counts))
 
         seat_means = means[envs, :, world.seats.long()]
@@ -72,7 +75,7 @@ class MonteCarloAgent:
 
         return arrdict.arrdict(
             logits=logits,
-            actions=torch.distributions.Categorical(logits=logits).sample(),
+            actions=heads.sample(logits),
             v=totals.sum(-2).div(counts.sum(-2)))
 
 
@@ -175,8 +178,9 @@ class All(arrdict.namedarrtuple(fields=('history', 'count'))):
         # Planted values for validation use
         self.logits = uniform_logits(self.valid)
 
-        correct_so_far = (self.history == 1).sum(-2) == self.count[..., None]
-        correct_to_go = 2**((self.history == 1).sum(-2) - self.length).float()
+        ones = (self.history == 1).sum(-2)
+        correct_so_far = ones == self.count[..., None]
+        correct_to_go = 2**(ones - self.length).float()
 
         v = correct_so_far.float()*correct_to_go
         self.v = v
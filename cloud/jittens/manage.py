@@ -4,6 +4,7 @@ from logging import getLogger
 from pathlib import Path
 from datetime import datetime
 import copy
+import time
 
 log = getLogger(__name__)
 
@@ -107,6 +108,7 @@ def fetch(source, target):
     ps = {}
     queue = iter(jobs().items())
     fetched = []
+    exhausted = False
     while True:
         # Anything more than 10 and default SSH configs start having trouble, throwing 235 & 255 errors.
         # Need to up `MaxStartups` if you wanna go higher.
@@ -120,13 +122,17 @@ def fetch(source, target):
                     else:
                         log.info(f'Skipping "{name}" as the machine "{job.machine}" is no longer available')
             except StopIteration:
+                exhausted = True
                 if not ps:
                     break
 
 
-        for name in list(ps):
+        # Only reap the rsyncs that have actually finished, so the rest keep running 
+        # concurrently rather than being joined one after another.
+        done = [name for name, p in ps.items() if p.runner.process_is_finished]
+        for name in done:
             try:
-                r = ps[name].join()
+                ps[name].join()
             except Exception as e:
                 log.info(f'Failed to fetch {name}: {e}')
             else:
@@ -134,6 +140,9 @@ def fetch(source, target):
                 fetched.append(name)
             del ps[name]
 
+        if not done and (exhausted or len(ps) > 4):
+            time.sleep(.1)
+
     return fetched
          
 def tails(path, jobglob='*', lineglob='*', count=5, display=True):
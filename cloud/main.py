@@ -23,21 +23,24 @@ def acknowledged(desc):
 
     return fresh + active + fetched
 
-def keystr(d):
-    return str({k: d[k] for k in ('boardsize', 'width', 'depth')})
+KEYS = ('boardsize', 'width', 'depth')
 
-def is_missing(proposal, acks):
-    return keystr(proposal) not in {keystr(a) for a in acks}
+def key(d):
+    # Params carry more than the identifying fields - nodes, desc - so only these go in the key
+    return frozenset((k, d[k]) for k in KEYS)
+
+def is_missing(proposal, ack_keys):
+    return key(proposal) not in ack_keys
 
 def launch():
     boardsize = 7
     desc = f'bee/{boardsize}'
-    acks = acknowledged(desc)
+    ack_keys = {key(a) for a in acknowledged(desc)}
     for nodes in [64]:
         for width in [256, 512]:
             for depth in [1, 2, 4]:
                 params = dict(width=width, depth=depth, boardsize=boardsize, nodes=nodes, desc=desc)
-                if is_missing(params, acks):
+                if is_missing(params, ack_keys):
                     log.info(f'Launching {params}')
                     jittens.jobs.submit(
                         cmd='python -c "from boardlaw.main import *; run_jittens()" >logs.txt 2>&1',
@@ -70,9 +73,13 @@ def refresh(forbidden=[]):
 
 def progress():
     active_jobs = jittens.jobs.jobs('active')
-    active_runs = runs.pandas()._env.dropna().apply(lambda p: p.get('JITTENS_NAME', '') in active_jobs).pipe(lambda s: s.index[s])
-    keys = runs.pandas().loc[active_runs, 'params'].apply(lambda p: (p['boardsize'], p['width'], p['depth']))
-    return data.load_field('elo-mohex', 'μ').resample('1min').mean().bfill().notnull().sum().reindex(keys.values)
+    rs = runs.pandas()
+    names = rs._env.dropna().map(lambda e: e.get('JITTENS_NAME', ''))
+    active_runs = names.index[names.isin(list(active_jobs))]
+    # Built straight from the dicts, since going through a frame turns ints into floats whenever a key's missing
+    params = rs.loc[active_runs, 'params'].tolist()
+    keys = pd.MultiIndex.from_tuples([tuple(p.get(k) for k in KEYS) for p in params], names=list(KEYS))
+    return data.load_field('elo-mohex', 'μ').resample('1min').mean().bfill().notnull().sum().reindex(keys)
 
 def offers():
     vast.offers('cuda_max_good >= 11.1 & gpu_name == "RTX 2080 Ti"')
@@ -28,7 +28,7 @@ def new_file(run, pattern, **kwargs):
         thread = threading.current_thread()
         info['_files'][filename] = {
             '_pattern': pattern,
-            '_created': str(tests.timestamp()),
+            '_created': tests.timestr(),
             '_process_id': str(process.pid),
             '_process_name': process.name,
             '_thread_id': str(thread.ident),
@@ -58,12 +58,19 @@ def lock(run, res=True):
 def infopath(run, res=True):
     return path(run, res) / '_info.json'
 
+def _write_info(path, val):
+    # Writers swap a complete new file into place, so readers always see either the old 
+    # version or the new one and don't need to take the lock.
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(val))
+    os.replace(tmp, path)
+
 def info(run, res=True):
-    with lock(run, res):
-        path = infopath(run, res)
-        if not path.exists():
-            raise ValueError(f'Run "{run}" info file has not been created yet')
+    path = infopath(run, res)
+    try:
         return json.loads(path.read_text())
+    except FileNotFoundError:
+        raise ValueError(f'Run "{run}" info file has not been created yet')
 
 def new_info(run, val={}, res=True):
     path = infopath(run, res)
@@ -73,7 +80,7 @@ def new_info(run, val={}, res=True):
             raise ValueError('Info file already exists')
         if not isinstance(val, dict):
             raise ValueError('Info value must be a dict')
-        path.write_text(json.dumps(val))
+        _write_info(path, val)
         return path
 
 @contextmanager
@@ -83,7 +90,7 @@ def update(run):
         path = infopath(run)
         i = json.loads(path.read_text())
         yield i
-        path.write_text(json.dumps(i))
+        _write_info(path, i)
 
         # Invalidate the cache
         _cache = {}
@@ -96,7 +103,7 @@ def new_name(suffix='', now=None):
     return f'{now} {hash} {suffix}'.strip()
 
 def new_run(suffix='', **kwargs):
-    now = tests.timestamp()
+    now = tests.now()
     run = new_name(suffix, now)
     kwargs = {**kwargs, 
         '_created': str(now), 
@@ -108,6 +115,7 @@ def new_run(suffix='', **kwargs):
     return run
 
 _cache = {}
+_mtimes = {}
 def runs(name=None, **kwargs):
     if name is not None or kwargs:
         res = set(resolutions(name, **kwargs))
@@ -115,17 +123,27 @@ def runs(name=None, **kwargs):
 
     global _cache
 
+    # Keying the cache on each info file's inode and mtime means a run only gets re-read when 
+    # something - possibly another process - has actually written to it. Info writes go through
+    # os.replace, so every write gets a new inode even if it lands within the same mtime tick.
     cache = {}
-    for dir in root().iterdir():
-        if dir.name in _cache:
-            cache[dir.name] = _cache[dir.name]
+    for entry in os.scandir(root()):
+        try:
+            stat = os.stat(os.path.join(entry.path, '_info.json'))
+            stamp = (stat.st_ino, stat.st_mtime_ns)
+        except (FileNotFoundError, NotADirectoryError):
+            # We'll end up here if the run's dir has been created, but 
+            # not the info file. That usually happens if we create a 
+            # run in another process.
+            continue
+
+        if (entry.name in _cache) and (_mtimes.get(entry.name) == stamp):
+            cache[entry.name] = _cache[entry.name]
         else:
             try:
-                cache[dir.name] = info(dir.name, res=False) 
+                cache[entry.name] = info(entry.name, res=False) 
+                _mtimes[entry.name] = stamp
             except ValueError:
-                # We'll end up here if the run's dir has been created, but 
-                # not the info file. That usually happens if we create a 
-                # run in another process.
                 pass
     
     order = sorted(cache, key=lambda n: cache[n]['_created']) 
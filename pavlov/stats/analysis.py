@@ -38,7 +38,24 @@ def compare(rs, channel, *args, query='', **kwargs):
         except OSError:
             log.info(f'Couldn\'t find data for "{n}"')
 
-    return pd.concat(df, 1)
+    return _columns(df)
+
+def _columns(df):
+    # Concatting lots of series with different indices pays for an index union and a reindex
+    # per series. Cheaper to take the union once and fill a preallocated array.
+    series = list(df.values())
+    aligned = (
+        series and 
+        all(isinstance(s, pd.Series) and s.index.is_unique for s in series) and
+        all(pd.api.types.is_numeric_dtype(s) for s in series))
+    if not aligned:
+        return pd.concat(df, 1)
+
+    idx = series[0].index.append([s.index for s in series[1:]]).unique().sort_values()
+    arr = np.full((len(idx), len(series)), np.nan)
+    for i, s in enumerate(series):
+        arr[idx.get_indexer(s.index), i] = s.values
+    return pd.DataFrame(arr, index=idx, columns=list(df))
 
 def plot(*args, ffill=False, skip=None, head=None, **kwargs):
     df = compare(*args, **kwargs)
@@ -8,7 +8,12 @@ from ... import numpy, tests, runs, files
 
 KINDS = {}
 
+PRIMITIVES = (int, float, str, bool, type(None))
+
 def clean(x):
+    # Most of what gets written is plain scalars, so let them skip the isinstance ladder
+    if type(x) in PRIMITIVES:
+        return x
     if isinstance(x, dict):
         return {k: clean(v) for k, v in x.items()}
     if isinstance(x, (tuple, list)):
@@ -19,19 +24,24 @@ def clean(x):
         x = x.item()
     return x
 
-def _collapse(x, prefix=''):
-    if isinstance(x, dict):
-        for k, v in x.items():
-            assert '.' not in k, 'Can\'t have periods in the key'
-            assert isinstance(k, str), 'Key must be a string'
-            yield from _collapse(v, f'{prefix}{k}.')
-    elif isinstance(x, (tuple, list)):
-        yield from [(f'{prefix}{i}', v) for i, v in enumerate(x)]
-    else:
-        yield prefix[:-1], x
-
 def collapse(x):
-    return dict(_collapse(x))
+    # This runs on every stats write, so walk the nesting with an explicit stack rather 
+    # than a chain of nested generators. Children go on in reverse so keys come out in order.
+    collapsed = {}
+    stack = [('', x)]
+    while stack:
+        prefix, x = stack.pop()
+        if isinstance(x, dict):
+            for k, v in reversed(list(x.items())):
+                assert '.' not in k, 'Can\'t have periods in the key'
+                assert isinstance(k, str), 'Key must be a string'
+                stack.append((f'{prefix}{k}.', v))
+        elif isinstance(x, (tuple, list)):
+            for i, v in enumerate(x):
+                collapsed[f'{prefix}{i}'] = v
+        else:
+            collapsed[prefix[:-1]] = x
+    return collapsed
 
 class TimeseriesReader:
 
@@ -39,22 +49,47 @@ class TimeseriesReader:
         self._created = runs.created(run)
         self.prefix = prefix
         self._reader = numpy.Reader(run, prefix)
-        self._arr = None
+        self._buf = None
+        self._len = 0
+
+    def _refresh(self):
+        # The buffer doubles whenever it fills, so a long-running reader copies its history 
+        # O(log N) times rather than on every read. Nothing before `_len` is ever written to in 
+        # place - growing or re-sorting goes into a fresh buffer - so the views `array` hands out 
+        # stay as they were.
+        for name, new in self._reader.read().items():
+            if self._buf is None:
+                self._buf = np.empty(max(1024, 2*len(new)), dtype=new.dtype)
+
+            end = self._len + len(new)
+            if end > len(self._buf):
+                grown = np.empty(max(2*len(self._buf), end), dtype=self._buf.dtype)
+                grown[:self._len] = self._buf[:self._len]
+                self._buf = grown
+            
+            self._buf[self._len:end] = new
+            
+            # New rows almost always come after the old ones, so only sort when they don't
+            times = self._buf['_time'][max(self._len-1, 0):end]
+            if (times[1:] < times[:-1]).any():
+                resorted = np.empty_like(self._buf)
+                resorted[:end] = self._buf[:end][np.argsort(self._buf['_time'][:end], kind='stable')]
+                self._buf = resorted
+            self._len = end
 
     def array(self):
-        #TODO: If this gets slow, do amortized allocation of arrays x2 as big as needed
-        for name, new in self._reader.read().items():
-            parts = [new] if self._arr is None else [self._arr, new]
-            joint = np.concatenate(parts)
-            self._arr = joint[np.argsort(joint['_time'])]
-        return self._arr
+        self._refresh()
+        return None if self._buf is None else self._buf[:self._len]
 
     def ready(self):
-        return self.array() is not None
+        self._refresh()
+        return self._buf is not None
 
     def pandas(self):
         arr = self.array()
-        df = pd.DataFrame.from_records(arr, index='_time')
+        # Handing over whole columns is much quicker than from_records
+        index = pd.Index(arr['_time'], name='_time')
+        df = pd.DataFrame({k: arr[k] for k in arr.dtype.names if k != '_time'}, index=index)
         if df.columns.str.contains(r'\.').any():
             df.columns = pd.MultiIndex.from_tuples([c.split('.') for c in df.columns])
         df.index = df.index.tz_localize('UTC') - self._created
@@ -68,8 +103,12 @@ class TimeseriesReader:
         resampled = self.resampler(**parts, rule=rule, **kwargs)
         return resampled
 
-def call_dict(f, *args, **kwargs):
-    call = inspect.getcallargs(f, *clean(args), **clean(kwargs))
+def call_dict(sig, *args, **kwargs):
+    # Binding against a signature that's built once is a lot cheaper than getcallargs, which 
+    # re-inspects the function on every write
+    bound = sig.bind(*clean(args), **clean(kwargs))
+    bound.apply_defaults()
+    call = dict(bound.arguments)
     del call['kwargs']
     call = collapse(call)
     return {'_time': tests.datetime64(), **call}
@@ -80,9 +119,10 @@ def timeseries(formatter=formatters.simple, plotter=plotters.Simple):
         """f provides the signature for the write call, and resamples the saved
         data when it's read."""
         kind = f.__name__
+        sig = inspect.signature(f)
 
         def write(channel, *args, **kwargs):
-            call = call_dict(f, *args, **kwargs)
+            call = call_dict(sig, *args, **kwargs)
             prefix = registry.make_prefix(channel)
             if registry.run() is not None:
                 w = registry.writer(prefix, lambda: numpy.Writer(registry.run(), prefix, kind=kind))
@@ -118,9 +158,10 @@ def arrays(formatter=formatters.null, plotter=plotters.Null):
 
     def factory(f):
         kind = f.__name__
+        sig = inspect.signature(f)
 
         def write(channel, *args, **kwargs):
-            call = call_dict(f, *args, **kwargs)
+            call = call_dict(sig, *args, **kwargs)
             filename = registry.make_prefix(channel) + '.npz'
             if registry.run() is not None:
                 path = files.path(registry.run(), filename)
@@ -141,3 +182,28 @@ def arrays(formatter=formatters.null, plotter=plotters.Null):
         return write
     
     return factory
+
+@tests.mock_dir
+def test_reader_out_of_order():
+    run = runs.new_run()
+    first, second = numpy.Writer(run, 'test'), numpy.Writer(run, 'test')
+    t = np.datetime64('2021-01-01T00:00:00')
+
+    first.write({'x': 2., '_time': t + np.timedelta64(2, 's')})
+    reader = TimeseriesReader(run, 'test')
+    before = reader.array()
+    assert before['x'].tolist() == [2.]
+
+    # A row from another writer that comes before the ones already read
+    second.write({'x': 1., '_time': t + np.timedelta64(1, 's')})
+    first.write({'x': 3., '_time': t + np.timedelta64(3, 's')})
+    after = reader.array()
+    assert after['x'].tolist() == [1., 2., 3.]
+    assert before['x'].tolist() == [2.]
+
+def test_collapse():
+    x = {'b': 1, 'a': {'d': (2, 3), 'c': {'e': 4}}, 'f': [5]}
+    collapsed = collapse(x)
+    assert list(collapsed.items()) == [('b', 1), ('a.d.0', 2), ('a.d.1', 3), ('a.c.e', 4), ('f.0', 5)]
+
+    assert collapse(7) == {'': 7}
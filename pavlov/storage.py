@@ -1,9 +1,12 @@
 import pickle
+import pytest
 import pandas as pd
 import torch
 import numpy as np
 from . import runs, files, tests
 from io import BytesIO
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 LATEST = 'storage.latest.pkl'
 SNAPSHOT = 'storage.snapshot.{n}.pkl'
@@ -52,19 +55,80 @@ def _save_raw(path, bs):
     path.with_suffix('.tmp').rename(path)
 
 def _save(path, objs):
-    #TODO: Is there a better way to do this?
-    bs = BytesIO()
-    torch.save(objs, bs)
-    _save_raw(path, bs.getvalue())
+    # Serializing straight to the temp file avoids holding a second, in-memory copy of 
+    # the whole checkpoint
+    tmp = path.with_suffix('.tmp')
+    torch.save(objs, tmp)
+    tmp.rename(path)
+
+def _copy(x):
+    # Training carries on updating the live tensors in place, so the writer needs its own copy
+    if isinstance(x, torch.Tensor):
+        return x.detach().to('cpu', copy=True)
+    if isinstance(x, dict):
+        y = type(x)((k, _copy(v)) for k, v in x.items())
+        if hasattr(x, '_metadata'):
+            y._metadata = x._metadata
+        return y
+    if isinstance(x, tuple) and hasattr(x, '_fields'):
+        return type(x)(*(_copy(v) for v in x))
+    if isinstance(x, (tuple, list)):
+        return type(x)(_copy(v) for v in x)
+    return x
+
+_writer = None
+_pending = []
+_targets = {}
+def _executor():
+    global _writer
+    if _writer is None:
+        _writer = ThreadPoolExecutor(1, thread_name_prefix='pavlov-storage')
+    return _writer
+
+def _reap():
+    """Forgets the writes that have finished, and raises the first error among them. Each error's 
+    only raised the once, since its write is forgotten before it's raised."""
+    global _pending, _targets
+    done = [future for future in _pending if future.done()]
+    _pending = [future for future in _pending if not future.done()]
+    _targets = {path: future for path, future in _targets.items() if not future.done()}
+    for future in done:
+        if not future.cancelled() and future.exception() is not None:
+            future.result()
+
+def _background(path, objs):
+    """Serializing and writing a checkpoint can take long enough to stall training, so it's 
+    done on a single writer thread instead. Jobs run in the order they're submitted."""
+    # An older write to the same path that hasn't started yet would only be overwritten
+    if path in _targets:
+        _targets[path].cancel()
+
+    future = _executor().submit(_save, path, _copy(objs))
+    _pending.append(future)
+    _targets[path] = future
+    return future
+
+def flush():
+    """Blocks until all the checkpoints submitted by this process have been written."""
+    for future in list(_pending):
+        if not future.cancelled():
+            future.result()
 
 def load_path(path, device='cpu'):
+    # Only need to wait on a write to this path. Writes run in order, so the most recent one 
+    # finishing means any earlier ones have too.
+    future = _targets.get(Path(path))
+    if (future is not None) and not future.cancelled():
+        future.result()
     return torch.load(path, map_location=device)
 
 def save_latest(run, objs):
-    path = files.path(run, LATEST)
-    if not path.exists():
+    _reap()
+    # The file's registered here rather than on the writer thread, so its info describes the caller. 
+    # Checking the info rather than the disk, since a submitted save mightn't have been written yet.
+    if LATEST not in runs.info(run)['_files']:
         files.new_file(run, LATEST)
-    _save(path, objs)
+    return _background(files.path(run, LATEST), objs)
 
 def load_latest(run=-1, device='cpu'):
     path = files.path(run, LATEST)
@@ -73,35 +137,54 @@ def load_latest(run=-1, device='cpu'):
 def timestamp_latest(run=-1):
     return pd.Timestamp(files.path(run, LATEST).stat().st_mtime, unit='s')
 
+_last_latest = {}
 def throttled_latest(run, objs, throttle):
-    if files.path(run, LATEST).exists():
-        last = pd.to_datetime(files.info(run, LATEST)['_created'])
-    else:
-        last = pd.Timestamp(0, unit='s', tz='UTC')
+    # These get called every training step, so only go to disk for the last save time once per run.
+    # The file's mtime is used since `_created` only records when the latest was first saved.
+    if run not in _last_latest:
+        path = files.path(run, LATEST)
+        if path.exists():
+            _last_latest[run] = pd.Timestamp(path.stat().st_mtime, unit='s', tz='UTC')
+        else:
+            _last_latest[run] = pd.Timestamp(0, unit='s', tz='UTC')
 
-    if tests.timestamp() > last + pd.Timedelta(throttle, 's'):
+    now = tests.timestamp()
+    if now > _last_latest[run] + pd.Timedelta(throttle, 's'):
         save_latest(run, objs)
+        _last_latest[run] = now
 
 def save_snapshot(run, objs, **kwargs):
+    _reap()
+    # Registering the file up front means `snapshots` sees it even while it's still queued
     path = files.new_file(run, SNAPSHOT, **kwargs)
-    _save(path, objs)
+    return _background(path, objs)
 
 def snapshots(run=-1):
-    return {files.idx(run, fn): {**info, 'path': files.path(run, fn)} for fn, info in files.seq(run, SNAPSHOT).items()}
+    # Resolve the run and read its info once, rather than once per snapshot via files.idx/files.path
+    run = runs.resolve(run)
+    root = runs.path(run, res=False)
+    front, back = SNAPSHOT.split('{n}')
+    return {
+        int(fn[len(front):len(fn)-len(back)]): {**info, 'path': root / fn} 
+        for fn, info in files.seq(run, SNAPSHOT).items()}
 
 def load_snapshot(run=-1, n=0, device='cpu'):
     path = files.path(run, SNAPSHOT.format(n=n))
     return load_path(path, device)
 
+_last_snapshot = {}
 def throttled_snapshot(run, objs, throttle):
-    files = snapshots(run)
-    if files:
-        last = pd.to_datetime(max(f['_created'] for f in files.values()))
-    else:
-        last = pd.Timestamp(0, unit='s', tz='UTC')
+    if run not in _last_snapshot:
+        files = snapshots(run)
+        if files:
+            _last_snapshot[run] = pd.to_datetime(max(f['_created'] for f in files.values()))
+        else:
+            _last_snapshot[run] = pd.Timestamp(0, unit='s', tz='UTC')
 
-    if tests.timestamp() > last + pd.Timedelta(throttle, 's'):
+    now = tests.timestamp()
+    if now > _last_snapshot[run] + pd.Timedelta(throttle, 's'):
         save_snapshot(run, objs)
+        _last_snapshot[run] = now
 
 def save_named(run, name, objs):
     name = NAMED.format(name=name)
@@ -149,4 +232,43 @@ def load_raw(run, name, device='cpu'):
     path = files.path(run, name)
     if path.exists():
         return mapped_loads(path.read_bytes(), device)
-    raise IOError(f'Couldn\'t find a file for "{run}" "{name}"')
\ No newline at end of file
+    raise IOError(f'Couldn\'t find a file for "{run}" "{name}"')
+@tests.mock_dir
+def test_background():
+    import threading
+    run = runs.new_run()
+
+    # Writes land in the order they're submitted
+    for i in range(3):
+        save_snapshot(run, {'x': torch.tensor(i)})
+    assert [load_snapshot(run, n)['x'].item() for n in range(3)] == [0, 1, 2]
+
+    # A latest that's still queued gets dropped in favour of the next one
+    gate = threading.Event()
+    _executor().submit(gate.wait)
+    first = save_latest(run, {'x': torch.tensor(3)})
+    second = save_latest(run, {'x': torch.tensor(4)})
+    assert first.cancelled()
+    gate.set()
+    assert load_latest(run)['x'].item() == 4
+    assert second.done()
+
+    # The writer has its own copy of the tensors, including ones inside tuples
+    x = torch.tensor(5)
+    save_snapshot(run, {'x': (x,)})
+    x.fill_(6)
+    assert load_snapshot(run, 3)['x'][0].item() == 5
+
+@tests.mock_dir
+def test_background_error():
+    run = runs.new_run()
+
+    failed = _background(runs.path(run) / 'missing' / 'storage.bad.pkl', {})
+    with pytest.raises(Exception):
+        failed.result()
+
+    # The error comes out of the next save, but only the once
+    with pytest.raises(Exception):
+        save_latest(run, {'x': torch.tensor(1)})
+    save_latest(run, {'x': torch.tensor(2)})
+    assert load_latest(run)['x'].item() == 2
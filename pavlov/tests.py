@@ -1,4 +1,5 @@
 import time as time_
+import datetime as datetime_
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -18,6 +19,20 @@ def timestamp():
         return pd.Timestamp.now('UTC')
     return pd.Timestamp(MOCK_NOW, unit='s', tz='UTC')
 
+def now():
+    # The stdlib counterpart to `timestamp`, for the hot spots where building a pandas 
+    # Timestamp is a noticeable cost
+    if MOCK_NOW is None:
+        return datetime_.datetime.now(datetime_.timezone.utc)
+    return timestamp().to_pydatetime()
+
+def timestr():
+    # Going through the stdlib is a good deal cheaper than building a pandas Timestamp, and 
+    # gives the same string
+    if MOCK_NOW is None:
+        return str(datetime_.datetime.now(datetime_.timezone.utc))
+    return str(timestamp())
+
 def time():
     return timestamp().value/1e9
 
@@ -2,6 +2,7 @@ from tqdm.auto import tqdm
 from contextlib import contextmanager
 import multiprocessing
 import types
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, _base, as_completed
 import logging
 from loky.process_executor import ProcessPoolExecutor as LokyPoolExecutor, _CURRENT_DEPTH, _process_worker, mp
@@ -29,19 +30,30 @@ class CUDAPoolExecutor(LokyPoolExecutor):
     # Passes the index of the process to the init, so that we can balance CUDA jobs
 
     @staticmethod
-    def _device_init(n, N):
+    def _device_init(device):
         import os
-        device = n % N
+        # If the parent was restricted to some devices, pick from its list rather than the raw indices
+        visible = os.environ.get('CUDA_VISIBLE_DEVICES')
+        if visible:
+            device = visible.split(',')[device]
         os.environ['CUDA_VISIBLE_DEVICES'] = str(device)
 
     def _adjust_process_count(self):
         assert self._initargs == (), 'Device executor doesn\'t currently support custom initializers'
         import torch
         N = torch.cuda.device_count()
+        assert N > 0, 'Device executor needs at least one CUDA device'
+
+        # Workers get respawned when they die, so balance against the devices held by the 
+        # live workers rather than going by spawn order
+        devices = {pid: d for pid, d in getattr(self, '_devices', {}).items() if pid in self._processes}
         for n in range(len(self._processes), self._max_workers):
+            counts = Counter(devices.values())
+            device = min(range(N), key=lambda d: counts[d])
+
             worker_exit_lock = self._context.BoundedSemaphore(1)
             args = (self._call_queue, self._result_queue, self._device_init,
-                    (n, N), self._processes_management_lock,
+                    (device,), self._processes_management_lock,
                     self._timeout, worker_exit_lock, _CURRENT_DEPTH + 1)
             worker_exit_lock.acquire()
             try:
@@ -54,6 +66,8 @@ class CUDAPoolExecutor(LokyPoolExecutor):
             p._worker_exit_lock = worker_exit_lock
             p.start()
             self._processes[p.pid] = p
+            devices[p.pid] = device
+        self._devices = devices
         mp.util.debug('Adjust process count : {}'.format(self._processes))
 
 